@@ -0,0 +1,92 @@
+"""
+Conversion Cache Module for PDF to LaTeX Converter
+Caches generated LaTeX in Redis, keyed by a hash of the input content
+"""
+
+import logging
+import blake3
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Cached conversions expire after 7 days
+CACHE_TTL = 7 * 24 * 60 * 60
+
+def content_key(data, prefix="latex"):
+    """
+    Build a content-addressed cache key
+    
+    Args:
+        data: Bytes to hash
+        prefix: Key namespace
+        
+    Returns:
+        str: Cache key of the form "<prefix>:<blake3 hex digest>"
+    """
+    return f"{prefix}:{blake3.blake3(data).hexdigest()}"
+
+class ConversionCache:
+    """
+    Redis-backed cache for generated LaTeX
+    
+    Every operation is a no-op when Redis is unavailable or fails, so the
+    cache can never break a conversion.
+    """
+    
+    def __init__(self, redis_client=None, ttl=CACHE_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+    
+    def get(self, key):
+        """
+        Look up cached LaTeX
+        
+        Args:
+            key: Cache key from content_key
+            
+        Returns:
+            str: Cached LaTeX code, or None on a miss
+        """
+        if self.redis_client is None:
+            return None
+        
+        try:
+            return self.redis_client.get(key)
+        except redis.RedisError as e:
+            logger.warning(f"Cache lookup failed: {str(e)}")
+            return None
+    
+    def get_many(self, keys):
+        """
+        Look up several cache entries in one round-trip
+        
+        Args:
+            keys: List of cache keys
+            
+        Returns:
+            list: Cached LaTeX code (or None on a miss) for each key
+        """
+        if self.redis_client is None or not keys:
+            return [None] * len(keys)
+        
+        try:
+            return self.redis_client.mget(keys)
+        except redis.RedisError as e:
+            logger.warning(f"Cache lookup failed: {str(e)}")
+            return [None] * len(keys)
+    
+    def set(self, key, latex_code):
+        """
+        Store LaTeX in the cache
+        
+        Args:
+            key: Cache key from content_key
+            latex_code: Generated LaTeX code
+        """
+        if self.redis_client is None:
+            return
+        
+        try:
+            self.redis_client.setex(key, self.ttl, latex_code)
+        except redis.RedisError as e:
+            logger.warning(f"Cache store failed: {str(e)}")
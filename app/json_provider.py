@@ -0,0 +1,101 @@
+"""
+JSON Provider Module for PDF to LaTeX Converter
+Serializes Flask JSON responses with orjson
+"""
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson
+    
+    Dates and dataclasses are passed through to Flask's default conversions
+    (HTTP dates, dataclasses.asdict) so responses match the stock provider;
+    other types orjson doesn't handle natively fall back the same way.
+    """
+    
+    def _options(self, indent=None, sort_keys=None):
+        """
+        Get orjson options for a dump
+        
+        Args:
+            indent: Indent requested by the caller; any truthy value maps to
+                orjson's only indent, two spaces
+            sort_keys: Whether to sort keys; defaults to the provider's setting
+            
+        Returns:
+            int: orjson option flags
+        """
+        options = (
+            orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+        
+        if indent is None:
+            # Match Flask's pretty-printing of responses in debug mode
+            indent = self.compact is False or (self.compact is None and self._app.debug)
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        
+        if sort_keys if sort_keys is not None else self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        
+        return options
+    
+    def dumps(self, obj, **kwargs):
+        """
+        Serialize data as JSON
+        
+        Supports the indent, sort_keys and default keyword arguments of
+        json.dumps. Others (ensure_ascii, separators, ...) have no orjson
+        equivalent and are ignored; output is always compact UTF-8 unless
+        indented.
+        
+        Args:
+            obj: Data to serialize
+            **kwargs: json.dumps-style options
+            
+        Returns:
+            str: JSON string
+        """
+        return orjson.dumps(
+            obj,
+            default=kwargs.get('default', self.default),
+            option=self._options(kwargs.get('indent', 0), kwargs.get('sort_keys'))
+        ).decode()
+    
+    def loads(self, s, **kwargs):
+        """
+        Deserialize data from JSON
+        
+        Args:
+            s: JSON text or bytes
+            **kwargs: Ignored; orjson takes no parsing options
+            
+        Returns:
+            Deserialized data
+        """
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """
+        Serialize data as a JSON response (what jsonify calls)
+        
+        orjson's bytes are written straight into the response without
+        decoding. Keys are sorted and debug output indented as with Flask's
+        default provider.
+        
+        Args:
+            *args: Data to serialize, as for jsonify
+            **kwargs: Data to serialize, as for jsonify
+            
+        Returns:
+            Response: Flask response with mimetype application/json
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options()),
+            mimetype=self.mimetype
+        )
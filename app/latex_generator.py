@@ -1,119 +1,653 @@
+import asyncio
+import atexit
+import concurrent.futures
 import os
-from openai import OpenAI
+import re
+import threading
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from .cache import ConversionCache, content_key
+
+# Number of PDF pages sent to GPT-4o per request; chunks are converted concurrently
+PAGES_PER_CHUNK = 4
+
+# Matches a leading ```/```latex and a trailing ``` markdown fence
+_FENCE_RE = re.compile(r'\A\s*```(?:latex)?|```\s*\Z')
+
+# Parses a \usepackage statement into its options and package names
+_USEPACKAGE_RE = re.compile(r'\\usepackage\s*(\[[^\]]*\])?\s*\{([^}]*)\}')
+
+# Matches a preamble definition and captures the macro or environment it defines
+_DEFINITION_RE = re.compile(
+    r'\\(?:(?:re)?newcommand|providecommand|DeclareMathOperator|def)\*?\s*\{?\s*(\\[A-Za-z@]+)'
+    r'|\\(?:(?:re)?newenvironment|newtheorem)\*?\s*\{([^}]+)\}'
+)
+
+# Preamble statements only the first chunk may contribute
+_FIRST_CHUNK_ONLY_RE = re.compile(r'\\(?:documentclass|title|author)\b')
+
+# Matches a \maketitle line in the body of a later chunk
+_MAKETITLE_RE = re.compile(r'^[ \t]*\\maketitle[ \t]*\n?', re.MULTILINE)
+
+# LaTeX comment, up to the end of the line (an escaped \% is not a comment)
+_COMMENT_RE = re.compile(r'(?<!\\)%.*')
+
+# Prompt sent with the first chunk of pages
+_PROMPT = """Please convert the content of these PDF pages to LaTeX code. 
+
+Requirements:
+1. Create a complete, compilable LaTeX document
+2. Include appropriate document class and packages
+3. Preserve the structure, formatting, and mathematical expressions
+4. Use proper LaTeX syntax for equations, tables, figures, etc.
+5. Include section headings and proper formatting
+6. If there are images or diagrams, describe them in comments
+7. Make sure the output is clean and well-formatted
+
+Return only the LaTeX code without any additional explanations or markdown formatting."""
+
+# Static leading part of the first chunk's content; page images are appended per chunk
+_PROMPT_CONTENT = (
+    {
+        "type": "text",
+        "text": _PROMPT
+    },
+)
+
+# Prompt sent with every later chunk of a multi-chunk document
+_CONTINUATION_PROMPT = """Please convert the content of these PDF pages to LaTeX code. 
+
+These are pages {first_page}-{last_page} of a larger document. The other pages are converted separately and the results are joined into one document.
+
+Requirements:
+1. Return only the part of the document for these pages, between \\begin{{document}} and \\end{{document}}
+2. Do not include \\documentclass, \\title, \\author or \\maketitle
+3. Above \\begin{{document}}, list the packages and macro definitions (\\newcommand, \\DeclareMathOperator, etc.) these pages use
+4. Preserve the structure, formatting, and mathematical expressions
+5. Use proper LaTeX syntax for equations, tables, figures, etc.
+6. If there are images or diagrams, describe them in comments
+7. Make sure the output is clean and well-formatted
+
+Return only the LaTeX code without any additional explanations or markdown formatting."""
+
+# Prompt for PDFs with a usable text layer; the extracted text of each page
+# follows it, along with the page's figures
+_TEXT_PROMPT = """Please convert the following PDF pages to LaTeX code. 
+
+The text of each page was extracted from the PDF and is given below, page by page. Images following a page's text are the figures on that page, or a rendering of the whole page when it is mostly vector graphics, has little extractable text or contains mathematics; convert the content of whole-page renderings as you would the text, taking equations from the rendering since extracted text loses their layout.
+
+Requirements:
+1. Create a complete, compilable LaTeX document
+2. Include appropriate document class and packages
+3. Reconstruct the structure, formatting, and mathematical expressions from the extracted text
+4. Use proper LaTeX syntax for equations, tables, figures, etc.
+5. Include section headings and proper formatting
+6. Describe the attached figures in comments where they appear
+7. Make sure the output is clean and well-formatted
+
+Return only the LaTeX code without any additional explanations or markdown formatting."""
+
+_TEXT_PROMPT_CONTENT = (
+    {
+        "type": "text",
+        "text": _TEXT_PROMPT
+    },
+)
+
+# Text-layer prompt for every later chunk of a multi-chunk document
+_TEXT_CONTINUATION_PROMPT = """Please convert the following PDF pages to LaTeX code. 
+
+These are pages {first_page}-{last_page} of a larger document. The other pages are converted separately and the results are joined into one document. The text of each page was extracted from the PDF and is given below, page by page. Images following a page's text are the figures on that page, or a rendering of the whole page when it is mostly vector graphics, has little extractable text or contains mathematics; convert the content of whole-page renderings as you would the text, taking equations from the rendering since extracted text loses their layout.
+
+Requirements:
+1. Return only the part of the document for these pages, between \\begin{{document}} and \\end{{document}}
+2. Do not include \\documentclass, \\title, \\author or \\maketitle
+3. Above \\begin{{document}}, list the packages and macro definitions (\\newcommand, \\DeclareMathOperator, etc.) these pages use
+4. Reconstruct the structure, formatting, and mathematical expressions from the extracted text
+5. Use proper LaTeX syntax for equations, tables, figures, etc.
+6. Describe the attached figures in comments where they appear
+7. Make sure the output is clean and well-formatted
+
+Return only the LaTeX code without any additional explanations or markdown formatting."""
+
+# Connection pool for OpenAI calls, shared by every request in the process
+_HTTPX_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
+# Maximum concurrent GPT-4o calls per process, across all requests; tune to
+# the account's rate limits. 429s are retried by the client with backoff.
+OAI_CONCURRENCY = int(os.getenv('OAI_CONCURRENCY', 8))
+OAI_MAX_RETRIES = int(os.getenv('OAI_MAX_RETRIES', 4))
+
+# Seconds a single GPT-4o attempt may take, and the most a whole conversion
+# waits for all of its chunks (including retries) before giving up
+OAI_TIMEOUT = float(os.getenv('OAI_TIMEOUT', 120))
+GENERATION_TIMEOUT = float(os.getenv('GENERATION_TIMEOUT', 300))
+
+# Seconds a worker's warm-up call may take; well under gunicorn's 30s timeout
+WARM_UP_TIMEOUT = 5.0
+
+# Process-wide OpenAI client and the event loop it runs on (created lazily)
+_CLIENT = None
+_LOOP = None
+_LOOP_THREAD = None
+_CLIENT_PID = None
+_CLIENT_LOCK = threading.Lock()
+
+# Guards chat.completions.create; created on the client's event loop
+_OAI_SEM = None
+
+def _get_client():
+    """
+    Get the process-wide AsyncOpenAI client
+    
+    The client and its HTTP/2 connection pool live on a dedicated event loop
+    thread so warm TLS connections are reused across requests. Both are
+    recreated if the loop thread has died or the process was forked after
+    they were created (e.g. gunicorn --preload), since a forked child
+    inherits the client but not the thread running its loop.
+    
+    Returns:
+        AsyncOpenAI: Shared OpenAI client
+    """
+    global _CLIENT, _LOOP, _LOOP_THREAD, _CLIENT_PID, _OAI_SEM
+    
+    with _CLIENT_LOCK:
+        if _CLIENT is not None and (_CLIENT_PID != os.getpid() or not _LOOP_THREAD.is_alive()):
+            _CLIENT = None
+            _OAI_SEM = None  # Bound to the old loop
+        
+        if _CLIENT is None:
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY environment variable is required")
+            
+            if _CLIENT_PID is None:
+                atexit.register(_close_client)
+            
+            _LOOP = asyncio.new_event_loop()
+            _LOOP_THREAD = threading.Thread(target=_LOOP.run_forever, name='openai-loop', daemon=True)
+            _LOOP_THREAD.start()
+            _CLIENT_PID = os.getpid()
+            
+            _CLIENT = AsyncOpenAI(
+                api_key=api_key,
+                max_retries=OAI_MAX_RETRIES,
+                timeout=OAI_TIMEOUT,
+                http_client=DefaultAsyncHttpxClient(limits=_HTTPX_LIMITS, http2=True)
+            )
+    
+    return _CLIENT
+
+def _run(coro, timeout=None):
+    """
+    Run a coroutine on the shared OpenAI event loop and wait for its result
+    
+    Args:
+        coro: Coroutine to run
+        timeout: Seconds to wait before cancelling the coroutine; None waits
+            for the OpenAI client's own timeouts and retries
+        
+    Returns:
+        The coroutine's result
+    """
+    _get_client()  # Makes sure the loop thread is running in this process
+    future = asyncio.run_coroutine_threadsafe(coro, _LOOP)
+    
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+def _semaphore():
+    """
+    Get the semaphore bounding concurrent OpenAI calls
+    
+    Must be called from the shared event loop, which binds the semaphore.
+    
+    Returns:
+        asyncio.Semaphore: Process-wide OpenAI call semaphore
+    """
+    global _OAI_SEM
+    
+    if _OAI_SEM is None:
+        _OAI_SEM = asyncio.Semaphore(OAI_CONCURRENCY)
+    
+    return _OAI_SEM
+
+def warm_up():
+    """
+    Open a connection to the OpenAI API ahead of the first request
+    
+    Issues a cheap models.list() call so the shared client's pool holds a
+    warm TLS connection. Runs a single attempt and gives up after
+    WARM_UP_TIMEOUT seconds, so a slow or unreachable API can't hold up
+    worker boot past gunicorn's worker timeout.
+    """
+    client = _get_client().with_options(timeout=WARM_UP_TIMEOUT, max_retries=0)
+    
+    async def _list_models():
+        await client.models.list()
+    
+    _run(_list_models(), timeout=WARM_UP_TIMEOUT + 1)
+
+def _close_client():
+    """Close the shared OpenAI client's connection pool at interpreter exit"""
+    try:
+        asyncio.run_coroutine_threadsafe(_CLIENT.close(), _LOOP).result(timeout=5)
+    except Exception:
+        pass
 
 class LaTeXGenerator:
     """Handles LaTeX generation using OpenAI GPT-4o API"""
     
-    def __init__(self):
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, cache=None):
+        _get_client()  # Fail fast if the API key is missing
+        self.cache = cache or ConversionCache()
+    
+    @property
+    def client(self):
+        """Shared OpenAI client, recreated after a fork"""
+        return _get_client()
     
     def generate_latex(self, images):
         """
         Generate LaTeX code from PDF page images using GPT-4o
         
+        Pages are split into chunks of PAGES_PER_CHUNK. Chunks whose pages
+        were converted before are served from the cache; the rest are
+        converted concurrently. All chunks are then stitched back into a
+        single document.
+        
         Args:
-            images: List of base64 encoded image strings
+            images: Iterable of (page_hash, base64 encoded image bytes) tuples
+            
+        Returns:
+            str: Generated LaTeX code
+        """
+        return self._generate(images, self._image_content, "latex-chunk")
+    
+    def generate_latex_from_text(self, pages):
+        """
+        Generate LaTeX code from a PDF's extracted text layer using GPT-4o
+        
+        GPT-4o only has to format the given text and describe the attached
+        figures instead of reading every page from an image. Chunking and
+        caching work as in generate_latex.
+        
+        Args:
+            pages: Iterable of (page_hash, (text, figures)) tuples, where
+                figures is a list of (mime_type, base64 encoded image bytes,
+                detail) tuples
+            
+        Returns:
+            str: Generated LaTeX code
+        """
+        return self._generate(pages, self._text_content, "latex-text-chunk")
+    
+    def _generate(self, pages, build_content, key_prefix):
+        """
+        Convert pages chunk by chunk, using the cache where possible
+        
+        Args:
+            pages: Iterable of (page_hash, page) tuples
+            build_content: Callable turning a chunk of pages and the
+                document page number of its first page into message content
+            key_prefix: Cache key namespace for the chunks
             
         Returns:
             str: Generated LaTeX code
         """
         try:
-            # Prepare message content with images
-            content = [
-                {
-                    "type": "text", 
-                    "text": self._get_conversion_prompt()
-                }
+            # Drain the page iterator on the calling thread and group pages into chunks
+            chunk_hashes = []
+            chunks = []
+            for page_hash, page in pages:
+                if not chunks or len(chunks[-1]) == PAGES_PER_CHUNK:
+                    chunk_hashes.append([])
+                    chunks.append([])
+                chunk_hashes[-1].append(page_hash)
+                chunks[-1].append(page)
+            
+            if not chunks:
+                raise ValueError("No pages found in PDF or failed to process pages")
+            
+            # Look up every chunk by the hashes of its pages. The first chunk is
+            # a complete document and later ones are bodies only, so they are
+            # cached separately; the page range in the prompt is not part of
+            # the key so moved pages still hit.
+            keys = [
+                content_key(b"".join(hashes), prefix=key_prefix if i == 0 else f"{key_prefix}-cont")
+                for i, hashes in enumerate(chunk_hashes)
             ]
+            results = self.cache.get_many(keys)
             
-            # Add images to the content
-            for image_data in images:
+            # Convert the missing chunks concurrently on the shared client's event loop
+            missing = [i for i, latex_code in enumerate(results) if latex_code is None]
+            if missing:
+                try:
+                    generated = _run(self._generate_chunks([
+                        (build_content(chunks[i], i * PAGES_PER_CHUNK + 1), i == 0)
+                        for i in missing
+                    ]), timeout=GENERATION_TIMEOUT)
+                except concurrent.futures.TimeoutError:
+                    raise Exception(f"OpenAI did not respond within {GENERATION_TIMEOUT:g} seconds")
+                
+                # Cache the chunks that succeeded so a retry only redoes the failed ones
+                error = None
+                for i, latex_code in zip(missing, generated):
+                    if isinstance(latex_code, BaseException):
+                        error = error or latex_code
+                        continue
+                    results[i] = latex_code
+                    self.cache.set(keys[i], latex_code)
+                
+                if error is not None:
+                    raise error
+            
+            return self._merge_chunks(results)
+                
+        except Exception as e:
+            raise Exception(f"LaTeX generation failed: {str(e)}")
+    
+    def _image_content(self, images, first_page):
+        """
+        Build message content for a chunk of page images
+        
+        Args:
+            images: List of base64 encoded image bytes
+            first_page: Document page number of the chunk's first page
+            
+        Returns:
+            list: Message content parts
+        """
+        # Prepare message content with images
+        content = self._prompt_content(
+            _PROMPT_CONTENT, _CONTINUATION_PROMPT, first_page, len(images)
+        )
+        
+        # Add images to the content; base64 is pure ASCII, so decode it as such
+        for image_data in images:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": "data:image/jpeg;base64," + image_data.decode('ascii'),
+                    "detail": "high"
+                }
+            })
+        
+        return content
+    
+    def _text_content(self, pages, first_page):
+        """
+        Build message content for a chunk of extracted text pages
+        
+        Args:
+            pages: List of (text, figures) tuples
+            first_page: Document page number of the chunk's first page
+            
+        Returns:
+            list: Message content parts
+        """
+        content = self._prompt_content(
+            _TEXT_PROMPT_CONTENT, _TEXT_CONTINUATION_PROMPT, first_page, len(pages)
+        )
+        
+        # Pages are numbered within the chunk only; document page numbers
+        # would make identical pages produce different chunk content
+        for page_num, (text, figures) in enumerate(pages, 1):
+            content.append({
+                "type": "text",
+                "text": f"--- Page {page_num} of this excerpt ---\n{text}"
+            })
+            
+            # Figures follow the text of the page they appear on
+            for mime_type, image_data, detail in figures:
                 content.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/png;base64,{image_data}",
-                        "detail": "high"
+                        "url": f"data:{mime_type};base64," + image_data.decode('ascii'),
+                        "detail": detail
                     }
                 })
+        
+        return content
+    
+    def _prompt_content(self, first_content, continuation_prompt, first_page, page_count):
+        """
+        Start a chunk's message content with the prompt for its position
+        
+        Args:
+            first_content: Static prompt content for the first chunk
+            continuation_prompt: Prompt template for later chunks
+            first_page: Document page number of the chunk's first page
+            page_count: Number of pages in the chunk
             
-            # Prepare the message
-            messages = [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
+        Returns:
+            list: Message content parts holding the prompt
+        """
+        if first_page == 1:
+            return list(first_content)
+        
+        return [{
+            "type": "text",
+            "text": continuation_prompt.format(
+                first_page=first_page, last_page=first_page + page_count - 1
+            )
+        }]
+    
+    async def _generate_chunks(self, requests):
+        """
+        Convert every chunk of pages concurrently
+        
+        Args:
+            requests: (content, complete) tuple for each chunk, where complete
+                is True if the chunk should return a complete document
+            
+        Returns:
+            list: Cleaned LaTeX code for each chunk, in page order, or the
+                exception raised for a chunk that failed
+        """
+        return await asyncio.gather(
+            *(self._generate_chunk(content, complete) for content, complete in requests),
+            return_exceptions=True
+        )
+    
+    async def _generate_chunk(self, content, complete=True):
+        """
+        Generate LaTeX code for a single chunk of pages
+        
+        Args:
+            content: Message content parts for the chunk
+            complete: Whether the chunk should be a complete document (the
+                first chunk) or only a body with its preamble additions
             
-            # Make API call
-            response = self.client.chat.completions.create(
+        Returns:
+            str: Cleaned LaTeX code for the chunk
+        """
+        # Prepare the message
+        messages = [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+        
+        # Make API call, waiting for a free slot if too many are in flight
+        async with _semaphore():
+            response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=messages,
                 temperature=0.0,  # Use 0.0 for deterministic output
-                max_tokens=4000   # Increase for longer documents
+                max_tokens=4000   # Per chunk, so long documents are not truncated
             )
+        
+        # Extract the generated LaTeX code
+        if response and response.choices and len(response.choices) > 0:
+            latex_code = response.choices[0].message.content
             
-            # Extract the generated LaTeX code
-            if response and response.choices and len(response.choices) > 0:
-                latex_code = response.choices[0].message.content
-                
-                # Clean up the response (remove code block markers if present)
-                latex_code = self._clean_latex_output(latex_code)
-                
-                return latex_code
-            else:
-                raise Exception("No response received from OpenAI API")
-                
-        except Exception as e:
-            raise Exception(f"LaTeX generation failed: {str(e)}")
+            # Clean up the response (remove code block markers if present)
+            return self._clean_latex_output(latex_code, complete)
+        else:
+            raise Exception("No response received from OpenAI API")
     
-    def _get_conversion_prompt(self):
+    def _merge_chunks(self, chunks):
         """
-        Get the prompt for LaTeX conversion
+        Stitch per-chunk LaTeX into a single document
         
+        The preamble of the first chunk is kept. Preamble statements of later
+        chunks are added to it, except \\documentclass, \\title and
+        \\author, packages already loaded (by name) and macros or
+        environments already defined. The bodies of all chunks are
+        concatenated in order, without the \\maketitle of later chunks.
+        
+        Args:
+            chunks: List of cleaned chunk LaTeX, in page order
+            
         Returns:
-            str: Conversion prompt for GPT-4o
+            str: Combined LaTeX code
         """
-        return """Please convert the content of these PDF pages to LaTeX code. 
-
-Requirements:
-1. Create a complete, compilable LaTeX document
-2. Include appropriate document class and packages
-3. Preserve the structure, formatting, and mathematical expressions
-4. Use proper LaTeX syntax for equations, tables, figures, etc.
-5. Include section headings and proper formatting
-6. If there are images or diagrams, describe them in comments
-7. Make sure the output is clean and well-formatted
-
-Return only the LaTeX code without any additional explanations or markdown formatting."""
+        if len(chunks) == 1:
+            return chunks[0]
+        
+        preamble, first_body = self._split_document(chunks[0])
+        bodies = [first_body]
+        
+        # Packages, definitions and statements the merged preamble already has
+        loaded = set()
+        for statement in self._preamble_statements(preamble):
+            self._carry_statement(statement, loaded)
+        
+        carried = []
+        for chunk in chunks[1:]:
+            chunk_preamble, body = self._split_document(chunk)
+            bodies.append(_MAKETITLE_RE.sub('', body).strip())
+            
+            for statement in self._preamble_statements(chunk_preamble):
+                statement = self._carry_statement(statement, loaded)
+                if statement:
+                    carried.append(statement)
+        
+        preamble = "\n".join([preamble.rstrip()] + carried)
+        body = "\n\n".join(body for body in bodies if body)
+        
+        return f"{preamble}\n\n\\begin{{document}}\n\n{body}\n\n\\end{{document}}"
+    
+    def _preamble_statements(self, preamble):
+        """
+        Split a preamble into statements
+        
+        A statement is a line, extended over following lines until its
+        braces balance, so multi-line definitions stay whole. Blank and
+        comment-only lines are dropped.
+        
+        Args:
+            preamble: LaTeX preamble
+            
+        Returns:
+            list: Preamble statements, in order
+        """
+        statements = []
+        current = []
+        depth = 0
+        
+        for line in preamble.splitlines():
+            code = _COMMENT_RE.sub('', line).replace('\\{', '').replace('\\}', '')
+            if not current and not code.strip():
+                continue
+            
+            current.append(line)
+            depth += code.count('{') - code.count('}')
+            if depth <= 0:
+                statements.append("\n".join(current).strip())
+                current = []
+                depth = 0
+        
+        if current:
+            statements.append("\n".join(current).strip())
+        
+        return statements
+    
+    def _carry_statement(self, statement, loaded):
+        """
+        Decide whether a later chunk's preamble statement joins the merged preamble
+        
+        Args:
+            statement: Preamble statement from _preamble_statements
+            loaded: Packages ("pkg:<name>"), definitions ("def:<name>") and
+                statements already in the merged preamble; updated in place
+            
+        Returns:
+            str: Statement to add (possibly narrowed to new packages), or None
+        """
+        if _FIRST_CHUNK_ONLY_RE.match(statement) or statement in loaded:
+            return None
+        loaded.add(statement)
+        
+        # Load each package once; differing options for one package would clash
+        match = _USEPACKAGE_RE.match(statement)
+        if match:
+            options = match.group(1) or ''
+            names = [name.strip() for name in match.group(2).split(',') if name.strip()]
+            new_names = [name for name in names if f"pkg:{name}" not in loaded]
+            loaded.update(f"pkg:{name}" for name in names)
+            
+            if not new_names:
+                return None
+            if len(new_names) < len(names):
+                return f"\\usepackage{options}{{{','.join(new_names)}}}"
+            return statement
+        
+        # Define each macro or environment once; redefinitions are errors
+        match = _DEFINITION_RE.match(statement)
+        if match:
+            name = f"def:{match.group(1) or match.group(2)}"
+            if name in loaded:
+                return None
+            loaded.add(name)
+        
+        return statement
     
-    def _clean_latex_output(self, latex_code):
+    def _split_document(self, latex_code):
+        """
+        Split a LaTeX document into its preamble and body
+        
+        Args:
+            latex_code: Cleaned LaTeX document
+            
+        Returns:
+            tuple: (preamble, body)
+        """
+        begin = latex_code.find('\\begin{document}')
+        if begin == -1:
+            return '', latex_code.strip()
+        
+        preamble = latex_code[:begin]
+        body = latex_code[begin + len('\\begin{document}'):]
+        
+        end = body.rfind('\\end{document}')
+        if end != -1:
+            body = body[:end]
+        
+        return preamble, body.strip()
+    
+    def _clean_latex_output(self, latex_code, complete=True):
         """
         Clean up the LaTeX output from the API
         
         Args:
             latex_code: Raw LaTeX code from API
+            complete: Whether the output must be a complete document; later
+                chunks only carry preamble additions and a body
             
         Returns:
             str: Cleaned LaTeX code
         """
-        # Remove markdown code block markers if present
-        if latex_code.startswith('```latex'):
-            latex_code = latex_code[8:]  # Remove ```latex
-        elif latex_code.startswith('```'):
-            latex_code = latex_code[3:]   # Remove ```
-        
-        if latex_code.endswith('```'):
-            latex_code = latex_code[:-3]  # Remove trailing ```
-        
-        # Strip whitespace
-        latex_code = latex_code.strip()
+        # Remove markdown code block markers if present and strip whitespace
+        latex_code = _FENCE_RE.sub('', latex_code).strip()
         
         # Ensure document starts with \documentclass if it doesn't already
-        if not latex_code.startswith('\\documentclass'):
+        if complete and not latex_code.startswith('\\documentclass'):
             # If it doesn't start with documentclass, wrap it in a basic document structure
             latex_code = f"""\\documentclass{{article}}
 \\usepackage[utf8]{{inputenc}}
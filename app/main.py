@@ -1,9 +1,14 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, current_app, request, render_template, jsonify
 from werkzeug.utils import secure_filename
 import os
 from .pdf_processor import PDFProcessor
 from .latex_generator import LaTeXGenerator
-from .rate_limiter import create_limiter, RateLimitConfig
+from .json_provider import OrjsonProvider
+from .rate_limiter import create_limiter, create_convert_limit, RateLimitConfig
+
+# Configuration read once at import instead of on every request
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 10485760))  # 10MB default
+DEBUG = os.getenv('FLASK_ENV', 'production') == 'development'
 
 def create_app():
     """Application factory pattern"""
@@ -12,16 +17,20 @@ def create_app():
                template_folder='../templates',
                static_folder='../static')
     
+    # Serialize JSON responses with orjson
+    app.json = OrjsonProvider(app)
+    
     # Load configuration
     app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
-    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_FILE_SIZE', 10485760))
-    app.config['DEBUG'] = os.getenv('FLASK_ENV', 'production') == 'development'
+    app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+    app.config['DEBUG'] = DEBUG
     
     # Initialize rate limiter BEFORE defining routes
     limiter = create_limiter(app)
+    convert_limit = create_convert_limit(app, limiter, RateLimitConfig.CONVERT_LIMITS)
     
-    # Initialize processors
-    pdf_processor = PDFProcessor()
+    # Initialize processors (one per app, shared by all requests)
+    app.extensions['pdf'] = PDFProcessor(app.extensions.get('redis'))
     
     @app.route('/')
     @limiter.limit(RateLimitConfig.GENERAL_LIMITS)
@@ -30,7 +39,7 @@ def create_app():
         return render_template('index.html')
 
     @app.route('/convert', methods=['POST'])
-    @limiter.limit(RateLimitConfig.CONVERT_LIMITS)  # 5 conversions per day limit
+    @convert_limit  # 5 conversions per day limit
     def convert_pdf():
         """Convert PDF to LaTeX endpoint"""
         if 'pdf_file' not in request.files:
@@ -44,18 +53,16 @@ def create_app():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({'error': 'Please upload a PDF file'}), 400
         
-        # Check file size (10MB limit)
-        file.seek(0, 2)  # Seek to end
-        file_size = file.tell()
-        file.seek(0)  # Reset to beginning
+        # Check file size (10MB limit); MAX_CONTENT_LENGTH already rejects
+        # larger bodies, so the request header is enough here
+        file_size = request.content_length or 0
         
-        max_size = int(os.getenv('MAX_FILE_SIZE', 10485760))  # 10MB default
-        if file_size > max_size:
-            return jsonify({'error': f'File too large. Maximum size is {max_size/1024/1024:.1f}MB'}), 400
+        if file_size > MAX_FILE_SIZE:
+            return jsonify({'error': f'File too large. Maximum size is {MAX_FILE_SIZE/1024/1024:.1f}MB'}), 400
         
         try:
             # Process PDF and generate LaTeX
-            latex_code = pdf_processor.convert_to_latex(file)
+            latex_code = current_app.extensions['pdf'].convert_to_latex(file)
             
             return jsonify({
                 'success': True,
@@ -94,7 +101,14 @@ def create_app():
         # Log rate limit hits for monitoring
         app.logger.warning(f"Rate limit hit for {request.remote_addr} on {endpoint}: {message}")
         
-        return jsonify(response_data), 429
+        # Keep the Retry-After (and any other) headers the exception carries
+        response = jsonify(response_data)
+        response.status_code = 429
+        for name, value in e.get_headers():
+            if name.lower() != 'content-type':
+                response.headers[name] = value
+        
+        return response
     
     return app
 
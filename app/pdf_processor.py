@@ -1,14 +1,68 @@
 import fitz  # PyMuPDF
 import base64
+import blake3
 import io
+import logging
+import re
+import threading
+from .cache import ConversionCache, content_key
 from .latex_generator import LaTeXGenerator
 from .rate_limiter import RateLimitConfig
 
+logger = logging.getLogger(__name__)
+
+# Page render resolutions, picked per page by content density. Plain text
+# OCRs fine at 150 DPI under GPT-4o's 512px tiling; pages with images or
+# dense vector graphics keep 300 DPI.
+TEXT_DPI = 150
+RENDER_DPI = 200
+FIGURE_DPI = 300
+
+# A page with at least this much extractable text and no figures is text-only
+TEXT_PAGE_MIN_CHARS = 500
+
+# A page with more vector drawing paths than this is treated as a figure
+# (as is one with an embedded image of at least FIGURE_MIN_SIZE)
+FIGURE_PAGE_MIN_DRAWINGS = 50
+
+# Average extractable characters per page above which the PDF's own text
+# layer is sent to GPT-4o instead of page images
+TEXT_LAYER_MIN_CHARS = 200
+
+# Embedded images smaller than this on either side are decoration, not figures
+FIGURE_MIN_SIZE = 64
+
+# An image covering at least this fraction of the page is a scan of the page
+# itself, not a figure on it
+SCANNED_PAGE_MIN_COVERAGE = 0.8
+
+# Fonts TeX and common math typesetting use for formulas (Computer Modern and
+# Latin Modern math, AMS symbols, STIX, Cambria Math, ...); subset
+# fonts carry a six-letter prefix such as ABCDEF+CMMI10
+_MATH_FONT_RE = re.compile(
+    r'(?:^|\+)(?:CMMI|CMSY|CMEX|MSAM|MSBM|EUFM|EUSM|EUEX|RSFS|LMMath|LatinModernMath'
+    r'|STIX\w*Math|Cambria[-\s]?Math|XITSMath|TeXGyre\w*Math|NewCM\w*Math|MTMI|MTSY|MTEX'
+    r'|txmi|txsy|txex|pxmi|pxsy|pxex)',
+    re.IGNORECASE
+)
+
+# MuPDF is not thread-safe; serializes every document operation in the process
+_MUPDF_LOCK = threading.Lock()
+
+# Precomputed scale matrix per render DPI (PDF user space is 72 DPI)
+_RENDER_MATRICES = {dpi: fitz.Matrix(dpi / 72, dpi / 72) for dpi in (TEXT_DPI, RENDER_DPI, FIGURE_DPI)}
+
+# The linearization dictionary of a linearized PDF lies within the first
+# 1024 bytes and declares the page count as /N
+_LINEARIZED_PEEK_SIZE = 1024
+_LINEARIZED_PAGES_RE = re.compile(rb'/Linearized\b[^>]*?/N\s+(\d+)')
+
 class PDFProcessor:
     """Handles PDF processing and conversion to LaTeX"""
     
-    def __init__(self):
-        self.latex_generator = LaTeXGenerator()
+    def __init__(self, redis_client=None):
+        self.cache = ConversionCache(redis_client)
+        self.latex_generator = LaTeXGenerator(self.cache)
     
     def convert_to_latex(self, pdf_file):
         """
@@ -21,101 +75,298 @@ class PDFProcessor:
             str: Generated LaTeX code
         """
         try:
-            # First, validate page count before processing
-            is_valid, page_count, error_msg = self._validate_page_count(pdf_file)
-            if not is_valid:
-                raise ValueError(error_msg)
+            # Reject oversized linearized PDFs from their header alone, before
+            # reading and parsing the whole upload
+            page_count = self._peek_page_count(pdf_file.read(_LINEARIZED_PEEK_SIZE))
+            pdf_file.seek(0)
+            if page_count is not None:
+                is_valid, _, error_msg = self._validate_page_count(page_count)
+                if not is_valid:
+                    raise ValueError(error_msg)
             
-            print(f"Processing PDF with {page_count} pages (limit: {RateLimitConfig.MAX_PAGES_PER_CONVERSION})")
+            pdf_data = pdf_file.read()
+            pdf_file.seek(0)  # Reset file pointer for later use
             
-            # Convert PDF pages to images
-            images = self._pdf_to_images(pdf_file)
+            # Repeat uploads of the same bytes are served from the cache
+            cache_key = content_key(pdf_data)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            if not images:
-                raise ValueError("No pages found in PDF or failed to process pages")
+            # Parse the upload once; validation and rendering share the document.
+            # MuPDF is not thread-safe, so everything touching the document runs
+            # under the process-wide lock and the OpenAI calls run after it.
+            with _MUPDF_LOCK:
+                doc = self._load_doc(pdf_data)
+                
+                try:
+                    # First, validate page count before processing
+                    is_valid, page_count, error_msg = self._validate_page_count(len(doc))
+                    if not is_valid:
+                        raise ValueError(error_msg)
+                    
+                    print(f"Processing PDF with {page_count} pages (limit: {RateLimitConfig.MAX_PAGES_PER_CONVERSION})")
+                    
+                    # Born-digital PDFs already carry a text layer; send it instead
+                    # of page images so GPT-4o doesn't have to OCR every page
+                    texts = [page.get_text("text") for page in doc.pages()]
+                    use_text = sum(len(text) for text in texts) / page_count > TEXT_LAYER_MIN_CHARS
+                    
+                    # Render one page at a time so only one pixmap is alive at once
+                    if use_text:
+                        pages = list(self._pdf_to_text(doc, texts))
+                    else:
+                        images = list(self._pdf_to_images(doc, texts))
+                finally:
+                    doc.close()
             
             # Generate LaTeX using AI
-            latex_code = self.latex_generator.generate_latex(images)
+            if use_text:
+                latex_code = self.latex_generator.generate_latex_from_text(pages)
+            else:
+                latex_code = self.latex_generator.generate_latex(images)
+            
+            self.cache.set(cache_key, latex_code)
             
             return latex_code
             
         except Exception as e:
             raise Exception(f"PDF processing failed: {str(e)}")
     
-    def _validate_page_count(self, pdf_file):
+    def _load_doc(self, pdf_data):
         """
-        Validate PDF page count against limits
+        Open the uploaded PDF
         
         Args:
-            pdf_file: Flask file object containing PDF data
+            pdf_data: Raw PDF bytes
             
         Returns:
-            tuple: (is_valid, page_count, error_message)
+            fitz.Document: Open PDF document; the caller must close it
         """
         try:
-            # Read PDF data
-            pdf_data = pdf_file.read()
-            pdf_file.seek(0)  # Reset file pointer for later use
+            return fitz.open(stream=pdf_data, filetype="pdf")
             
-            # Open PDF to get page count
-            doc = fitz.open(stream=pdf_data, filetype="pdf")
-            page_count = len(doc)
-            doc.close()
+        except Exception as e:
+            raise ValueError(f"Could not open PDF: {str(e)}")
+    
+    def _peek_page_count(self, head):
+        """
+        Read the page count from a linearized PDF's header
+        
+        Args:
+            head: First bytes of the PDF file
+            
+        Returns:
+            int: Declared page count, or None if the PDF is not linearized
+        """
+        match = _LINEARIZED_PAGES_RE.search(head)
+        return int(match.group(1)) if match else None
+    
+    def _validate_page_count(self, page_count):
+        """
+        Validate PDF page count against limits
+        
+        Args:
+            page_count: Number of pages in the PDF
             
-            # Check against limit
-            if page_count > RateLimitConfig.MAX_PAGES_PER_CONVERSION:
-                error_msg = (
-                    f"PDF has {page_count} pages, but maximum allowed is "
-                    f"{RateLimitConfig.MAX_PAGES_PER_CONVERSION} pages per conversion. "
-                    "Please split your document into smaller files."
-                )
-                return False, page_count, error_msg
+        Returns:
+            tuple: (is_valid, page_count, error_message)
+        """
+        # Check against limit
+        if page_count > RateLimitConfig.MAX_PAGES_PER_CONVERSION:
+            error_msg = (
+                f"PDF has {page_count} pages, but maximum allowed is "
+                f"{RateLimitConfig.MAX_PAGES_PER_CONVERSION} pages per conversion. "
+                "Please split your document into smaller files."
+            )
+            return False, page_count, error_msg
+        
+        if page_count == 0:
+            return False, 0, "PDF appears to be empty or corrupted."
+        
+        return True, page_count, None
+    
+    def _pdf_to_images(self, doc, texts):
+        """
+        Convert PDF pages to base64 encoded images
+        
+        Pages are rendered lazily, one at a time, so only a single page's
+        pixmap is alive while the caller assembles the request body.
+        
+        Args:
+            doc: Open fitz.Document
+            texts: Extracted text of each page, in page order
+            
+        Yields:
+            tuple: (page_hash, base64 encoded image bytes) for each page, in page order
+        """
+        for page, text in zip(doc.pages(), texts):
+            yield self._render_page(page, text, len(page.get_cdrawings()))
+    
+    def _render_page(self, page, text, drawing_count):
+        """
+        Render a single PDF page to a base64 encoded image
+        
+        Args:
+            page: fitz.Page to render
+            text: Extracted text of the page
+            drawing_count: Number of vector drawing paths on the page
             
-            if page_count == 0:
-                return False, 0, "PDF appears to be empty or corrupted."
+        Returns:
+            tuple: (page_hash, base64 encoded image bytes), where page_hash
+                is the BLAKE3 digest of the encoded image
+        """
+        try:
+            # Convert page to image at a resolution suited to its content
+            pix = page.get_pixmap(matrix=_RENDER_MATRICES[self._page_dpi(page, text, drawing_count)])
+            img_data = pix.tobytes("jpeg", jpg_quality=85)
+            pix = None  # Let MuPDF reclaim the pixel buffer before the next page
             
-            return True, page_count, None
+            # Encode to base64; kept as bytes until the request body is built
+            return blake3.blake3(img_data).digest(), base64.b64encode(img_data)
             
         except Exception as e:
-            error_msg = f"Could not validate PDF: {str(e)}"
-            return False, 0, error_msg
+            raise Exception(f"Failed to convert PDF to images: {str(e)}")
     
-    def _pdf_to_images(self, pdf_file):
+    def _pdf_to_text(self, doc, texts):
         """
-        Convert PDF pages to base64 encoded images
+        Pair each page's extracted text with its figures
         
         Args:
-            pdf_file: Flask file object containing PDF data
+            doc: Open fitz.Document
+            texts: Extracted text of each page, in page order
+            
+        Yields:
+            tuple: (page_hash, (text, figures)) for each page, in page order,
+                where figures is a list of (mime_type, base64 encoded image
+                bytes, detail) tuples
+        """
+        for page, text in zip(doc.pages(), texts):
+            yield self._text_page(doc, page, text)
+    
+    def _text_page(self, doc, page, text):
+        """
+        Collect the figures of a text page
+        
+        Pages dominated by vector graphics, with too little text to stand on
+        their own, or set in math fonts get a full-page render at high detail
+        instead.
+        
+        Args:
+            doc: Open fitz.Document
+            page: fitz.Page the text belongs to
+            text: Extracted text of the page
             
         Returns:
-            list: List of base64 encoded image strings
+            tuple: (page_hash, (text, figures)), where page_hash is the BLAKE3
+                digest of the text and figure images
         """
         try:
-            # Read PDF data into memory
-            pdf_data = pdf_file.read()
-            pdf_file.seek(0)  # Reset file pointer
+            drawing_count = len(page.get_cdrawings())
             
-            # Open PDF document
-            doc = fitz.open(stream=pdf_data, filetype="pdf")
-            images = []
+            if (drawing_count > FIGURE_PAGE_MIN_DRAWINGS or len(text) < TEXT_PAGE_MIN_CHARS
+                    or self._has_math(page)):
+                # Vector graphics can't be extracted as images, pages with
+                # little text (scans, full-page images) would lose their
+                # content as described figures, and extracted text flattens
+                # equations; send the whole page instead
+                _, image_data = self._render_page(page, text, drawing_count)
+                figures = [("image/jpeg", image_data, "high")]
+            else:
+                figures = []
+                for image in page.get_images(full=True):
+                    # A figure that can't be decoded is dropped rather than failing the page
+                    try:
+                        figure = self._extract_figure(doc, image[0])
+                    except Exception as e:
+                        logger.warning(f"Skipping figure {image[0]} on page {page.number + 1}: {str(e)}")
+                        continue
+                    if figure is not None:
+                        figures.append(figure)
             
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                
-                # Convert page to high-resolution image
-                # Using 300 DPI for good quality
-                pix = page.get_pixmap(dpi=300)
-                img_data = pix.tobytes("png")
-                
-                # Encode to base64
-                encoded_image = base64.b64encode(img_data).decode('utf-8')
-                images.append(encoded_image)
+            hasher = blake3.blake3(text.encode('utf-8'))
+            for _, image_data, _ in figures:
+                hasher.update(image_data)
             
-            doc.close()
-            return images
+            return hasher.digest(), (text, figures)
             
         except Exception as e:
-            raise Exception(f"Failed to convert PDF to images: {str(e)}")
+            raise Exception(f"Failed to extract PDF text: {str(e)}")
+    
+    def _has_math(self, page):
+        """
+        Check whether a page typesets mathematics
+        
+        Args:
+            page: fitz.Page to inspect
+            
+        Returns:
+            bool: True if the page uses a math font
+        """
+        return any(_MATH_FONT_RE.search(font[3]) for font in page.get_fonts())
+    
+    def _extract_figure(self, doc, xref):
+        """
+        Extract an embedded image as a figure for GPT-4o
+        
+        Args:
+            doc: Open fitz.Document
+            xref: Cross-reference number of the image
+            
+        Returns:
+            tuple: (mime_type, base64 encoded image bytes, detail), or None
+                if the image is too small to be a figure
+        """
+        image = doc.extract_image(xref)
+        if not image or image["width"] < FIGURE_MIN_SIZE or image["height"] < FIGURE_MIN_SIZE:
+            return None
+        
+        if image["ext"] in ("png", "jpeg") and image["colorspace"] <= 3:
+            mime_type, img_data = f"image/{image['ext']}", image["image"]
+        else:
+            # Formats GPT-4o can't read (JPX, JBIG2, CMYK, ...) are converted to PNG
+            pix = fitz.Pixmap(doc, xref)
+            if pix.colorspace and pix.colorspace.n > 3:
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+            mime_type, img_data = "image/png", pix.tobytes("png")
+            pix = None
+        
+        # Figures only need describing, so low detail is enough
+        return mime_type, base64.b64encode(img_data), "low"
+    
+    def _page_dpi(self, page, text, drawing_count):
+        """
+        Pick the render resolution for a page from its content
+        
+        Args:
+            page: fitz.Page to inspect
+            text: Extracted text of the page
+            drawing_count: Number of vector drawing paths on the page
+            
+        Returns:
+            int: TEXT_DPI, RENDER_DPI or FIGURE_DPI
+        """
+        # Small images (logos, icons) don't need the extra resolution, and a
+        # scanned page's own image is no finer than its scan
+        has_figure = any(
+            width >= FIGURE_MIN_SIZE and height >= FIGURE_MIN_SIZE
+            for _, _, width, height, *_ in page.get_images(full=True)
+        )
+        if has_figure:
+            page_area = abs(page.rect)
+            has_figure = any(
+                info["width"] >= FIGURE_MIN_SIZE and info["height"] >= FIGURE_MIN_SIZE
+                and abs(fitz.Rect(info["bbox"]) & page.rect) < SCANNED_PAGE_MIN_COVERAGE * page_area
+                for info in page.get_image_info()
+            )
+        
+        if has_figure or drawing_count > FIGURE_PAGE_MIN_DRAWINGS:
+            return FIGURE_DPI
+        
+        if len(text) >= TEXT_PAGE_MIN_CHARS:
+            return TEXT_DPI
+        
+        return RENDER_DPI
     
     def get_pdf_info(self, pdf_file):
         """
@@ -131,13 +382,14 @@ class PDFProcessor:
             pdf_data = pdf_file.read()
             pdf_file.seek(0)  # Reset file pointer
             
-            doc = fitz.open(stream=pdf_data, filetype="pdf")
-            info = {
-                'page_count': len(doc),
-                'title': doc.metadata.get('title', ''),
-                'author': doc.metadata.get('author', ''),
-            }
-            doc.close()
+            with _MUPDF_LOCK:
+                doc = fitz.open(stream=pdf_data, filetype="pdf")
+                info = {
+                    'page_count': len(doc),
+                    'title': doc.metadata.get('title', ''),
+                    'author': doc.metadata.get('author', ''),
+                }
+                doc.close()
             
             return info
             
@@ -6,9 +6,70 @@ Implements user-based rate limiting with Redis backend
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask import request
+from werkzeug.exceptions import TooManyRequests
+from limits import parse
 import redis
 import os
-import hashlib
+import time
+import xxhash
+from functools import lru_cache, wraps
+
+# Token bucket evaluated atomically inside Redis: refills, checks and
+# decrements every bucket of a request in a single round-trip.
+#   KEYS[i]                     bucket key for limit i
+#   ARGV[1]                     current time in seconds
+#   ARGV[2i], ARGV[2i + 1]      capacity and refill period (seconds) of limit i
+# Returns {allowed, retry_after_seconds, remaining_tokens}
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = capacity / tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local last = tonumber(state[2]) or now
+
+    available = math.min(capacity, available + math.max(0, now - last) * rate)
+    tokens[i] = available
+
+    if available < 1 then
+        retry_after = math.max(retry_after, math.ceil((1 - available) / rate))
+    end
+end
+
+if retry_after > 0 then
+    return {0, retry_after, 0}
+end
+
+local remaining = nil
+for i, key in ipairs(KEYS) do
+    local period = tonumber(ARGV[i * 2 + 1])
+    local left = tokens[i] - 1
+    redis.call('HSET', key, 'tokens', tostring(left), 'ts', ARGV[1])
+    redis.call('EXPIRE', key, math.ceil(period))
+    if remaining == nil or left < remaining then
+        remaining = left
+    end
+end
+
+return {1, 0, math.floor(remaining)}
+"""
+
+@lru_cache(maxsize=4096)
+def _ua_hash(user_agent):
+    """
+    Short non-cryptographic fingerprint of a User-Agent string
+    
+    Args:
+        user_agent: Raw User-Agent header value
+        
+    Returns:
+        str: Hex fingerprint (8 characters at most)
+    """
+    return format(xxhash.xxh64_intdigest(user_agent), 'x')[:8]
 
 def get_user_id():
     """
@@ -24,7 +85,7 @@ def get_user_id():
     
     # Create a more stable user identifier using IP + User Agent hash
     user_agent = request.headers.get('User-Agent', '')
-    user_fingerprint = f"{remote_ip}:{hashlib.md5(user_agent.encode()).hexdigest()[:8]}"
+    user_fingerprint = f"{remote_ip}:{_ua_hash(user_agent)}"
     
     return f"user:{user_fingerprint}"
 
@@ -50,6 +111,7 @@ def create_limiter(app):
         app.logger.info("✅ Connected to Redis for rate limiting")
     except Exception as e:
         # Fallback to in-memory storage (not recommended for production)
+        redis_client = None
         storage_uri = "memory://"
         app.logger.warning(f"⚠️  Redis connection failed ({e}), using in-memory rate limiting")
         app.logger.warning("💡 For production, please configure Redis properly")
@@ -65,8 +127,105 @@ def create_limiter(app):
         swallow_errors=True,   # Don't crash on rate limiter errors
     )
     
+    # Share the Redis connection (None when unavailable) with other components
+    app.extensions['redis'] = redis_client
+    
     return limiter
 
+def create_convert_limit(app, limiter, limit_values):
+    """
+    Build the rate limit decorator for the conversion endpoint
+    
+    Uses a Redis token bucket (one round-trip per request) when Redis is
+    available, otherwise falls back to Flask-Limiter's in-memory limits.
+    
+    Args:
+        app: Flask application instance
+        limiter: Flask-Limiter instance from create_limiter
+        limit_values: Limit strings such as "5 per day"
+        
+    Returns:
+        callable: View decorator
+    """
+    redis_client = app.extensions.get('redis')
+    if redis_client is None:
+        return limiter.limit(limit_values)
+    
+    bucket_limit = TokenBucketLimiter(redis_client).limit(limit_values)
+    
+    def decorator(view):
+        # Exempt from Flask-Limiter so its default limits don't add round-trips
+        return limiter.exempt(bucket_limit(view))
+    
+    return decorator
+
+class TokenBucketLimiter:
+    """
+    Token bucket rate limiter evaluated atomically in Redis
+    
+    Every limit of a request is checked and consumed by one Lua script
+    call (EVALSHA, loaded on first use).
+    """
+    
+    def __init__(self, redis_client, key_prefix="bucket"):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+    
+    def hit(self, keys, items):
+        """
+        Consume one token from each bucket
+        
+        Args:
+            keys: Redis key for each bucket
+            items: Parsed rate limit item for each bucket
+            
+        Returns:
+            tuple: (allowed, retry_after_seconds, remaining_tokens)
+        """
+        args = [time.time()]
+        for item in items:
+            args.extend([item.amount, item.get_expiry()])
+        
+        allowed, retry_after, remaining = self.script(keys=keys, args=args)
+        return bool(allowed), int(retry_after), int(remaining)
+    
+    def limit(self, limit_values):
+        """
+        Decorator applying token bucket limits to a view
+        
+        Args:
+            limit_values: Limit strings such as "5 per day"
+            
+        Returns:
+            callable: View decorator
+        """
+        items = [parse(value) for value in limit_values]
+        
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                user_id = get_user_id()
+                keys = [
+                    f"{self.key_prefix}:{request.endpoint}:{item.amount}/{item.get_expiry()}:{user_id}"
+                    for item in items
+                ]
+                
+                try:
+                    allowed, retry_after, _ = self.hit(keys, items)
+                except redis.RedisError:
+                    # Don't block requests on Redis errors (same as swallow_errors)
+                    allowed = True
+                
+                if not allowed:
+                    raise TooManyRequests(retry_after=retry_after)
+                
+                return view(*args, **kwargs)
+            
+            return wrapper
+        
+        return decorator
+
 class RateLimitConfig:
     """
     Rate limiting configuration for different endpoints
@@ -118,7 +277,7 @@ class RateLimitConfig:
         messages = {
             "convert": (
                 "You've reached your daily limit of 5 PDF conversions. "
-                "Please try again tomorrow. This helps us keep the service "
+                "Please try again later. This helps us keep the service "
                 "free and available for everyone!"
             ),
             "general": (
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for PDF to LaTeX Converter
+Worker settings are passed on the command line by run.py
+"""
+
+import fitz  # PyMuPDF
+
+def post_worker_init(worker):
+    """
+    Warm up a freshly booted worker before it accepts requests
+    
+    Renders a blank page so MuPDF's rendering paths are loaded, and opens
+    the OpenAI connection pool so the first conversion skips the TLS handshake.
+    The OpenAI call is a single attempt bounded by WARM_UP_TIMEOUT; if it
+    fails the worker starts cold.
+    """
+    doc = fitz.open()
+    doc.new_page().get_pixmap(dpi=72)
+    doc.close()
+    
+    try:
+        from app.latex_generator import warm_up
+        warm_up()
+    except Exception as e:
+        worker.log.warning(f"OpenAI warm-up failed: {str(e) or type(e).__name__}")
@@ -4,16 +4,12 @@ PDF to LaTeX Converter - Application Entry Point
 """
 
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Import and create the Flask application
-from app.main import create_app
-
-app = create_app()
-
 if __name__ == '__main__':
     # Get configuration from environment
     debug = os.getenv('FLASK_ENV', 'production') == 'development'
@@ -24,4 +20,25 @@ if __name__ == '__main__':
     print(f"Debug mode: {'ON' if debug else 'OFF'}")
     print(f"Access the application at: http://{host}:{port}")
     
-    app.run(debug=debug, host=host, port=port)
+    if debug:
+        # Import the Flask application (created once by app.main)
+        from app.main import app
+        app.run(debug=debug, host=host, port=port)
+    else:
+        # Hand the process over to gunicorn with threaded workers so long
+        # OpenAI calls don't block other requests (including /health); the
+        # app is only imported by the workers. PDF work is serialized per
+        # process by PDFProcessor, so threads only overlap on OpenAI I/O.
+        workers = os.getenv('GUNICORN_WORKERS', str(os.cpu_count() or 1))
+        threads = os.getenv('GUNICORN_THREADS', '8')
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        os.execv(sys.executable, [
+            sys.executable, '-m', 'gunicorn',
+            '--chdir', base_dir,
+            '--config', os.path.join(base_dir, 'gunicorn.conf.py'),
+            '--worker-class', 'gthread',
+            '--workers', workers,
+            '--threads', threads,
+            '--bind', f'{host}:{port}',
+            'app.main:app',
+        ])
@@ -99,6 +99,20 @@ function formatFileSize(bytes) {
     return parseFloat((bytes / Math.pow(k, i)).toFixed(2)) + ' ' + sizes[i];
 }
 
+// Format a Retry-After delay in seconds
+function formatRetryAfter(seconds) {
+    seconds = Math.ceil(Number(seconds));
+    
+    if (seconds < 60) return `${seconds} second${seconds === 1 ? '' : 's'}`;
+    
+    const minutes = Math.ceil(seconds / 60);
+    if (minutes < 60) return `${minutes} minute${minutes === 1 ? '' : 's'}`;
+    
+    const hours = Math.floor(minutes / 60);
+    const rest = minutes % 60;
+    return `${hours} hour${hours === 1 ? '' : 's'}` + (rest ? ` ${rest} minute${rest === 1 ? '' : 's'}` : '');
+}
+
 // Clear selected file
 function clearFile() {
     selectedFile = null;
@@ -138,16 +152,13 @@ async function convertPDF() {
             showResults(result.latex_code);
         } else if (response.status === 429) {
             // Rate limit exceeded - special handling
-            const retryAfter = response.headers.get('Retry-After');
-            const limitType = result.limit_type || 'general';
+            const retryAfter = result.retry_after || response.headers.get('Retry-After');
             
             let message = result.message || 'Rate limit exceeded. Please try again later.';
             
-            if (limitType === 'convert') {
-                // Daily conversion limit hit
-                message = result.message + '\n\nRate limit resets at midnight UTC.';
-            } else if (retryAfter) {
-                message += `\n\nYou can try again in ${retryAfter} seconds.`;
+            if (retryAfter) {
+                // Conversions refill gradually, so report when the next one is available
+                message += `\n\nYou can try again in ${formatRetryAfter(retryAfter)}.`;
             }
             
             throw new Error(message);